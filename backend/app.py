@@ -4,11 +4,20 @@ import json
 import os
 import threading
 import time
+import uuid
 from llm_interface import (
     generate_prompt_with_timing, 
     generate_countdown_number,
-    generate_final_message
+    generate_final_message,
+    get_generation_metrics,
+    get_cancellation_metrics,
+    record_first_prompt,
+    warmup_manager,
+    CancellationToken,
+    GenerationCancelled,
+    GENERATION_PROFILES
 )
+from prompt_log import PromptLog, PROMPT_LOG_CAPACITY
 from storage import save_character, load_character, save_settings, load_settings, save_theme, load_theme
 
 app = Flask(__name__, static_folder='../frontend')
@@ -68,7 +77,7 @@ def get_settings_route():
 def start_session():
     """Start a new prompt generation session"""
     session_config = request.json
-    session_id = str(time.time())  # Simple unique ID
+    session_id = uuid.uuid4().hex  # Collision-free under concurrent starts
     
     # Get character and theme if not provided
     if 'character' not in session_config:
@@ -80,13 +89,17 @@ def start_session():
     # Store session config
     active_sessions[session_id] = {
         "config": session_config,
-        "prompts": [],
+        "prompt_log": PromptLog(PROMPT_LOG_CAPACITY),
         "active": True,
+        "cancel_token": CancellationToken(),
         "countdown_active": False,
         "countdown_current": None,
         "countdown_end": 3  # Stop countdown at this number or lower
     }
     
+    # Preload the models and keep them resident while the session runs
+    warmup_manager.session_started()
+    
     # Start prompt generation in a background thread
     thread = threading.Thread(
         target=prompt_generation_loop,
@@ -101,8 +114,10 @@ def start_session():
 def stop_session(session_id):
     """Stop an active prompt generation session"""
     if session_id in active_sessions:
-        # Mark the session as inactive - the loop will handle cleanup
+        # Mark the session as inactive and wake/abort the generator thread -
+        # the loop will handle cleanup
         active_sessions[session_id]["active"] = False
+        active_sessions[session_id]["cancel_token"].cancel()
         return jsonify({"status": "success"})
     return jsonify({"status": "error", "message": "Session not found"}), 404
 
@@ -112,55 +127,60 @@ def get_prompts(session_id):
     if session_id in active_sessions:
         # Return only prompts that haven't been seen yet
         last_seen = int(request.args.get('last_seen', -1))
-        new_prompts = active_sessions[session_id]["prompts"][last_seen+1:]
+        new_prompts = active_sessions[session_id]["prompt_log"].read_since(last_seen)
         
         return jsonify({
-            "prompts": new_prompts,
+            "prompts": [prompt.to_dict() for prompt in new_prompts],
             "complete": not active_sessions[session_id]["active"]
         })
     return jsonify({"status": "error", "message": "Session not found"}), 404
 
-def add_prompt_to_session(session_id, prompt_text, timestamp=None, next_interval=None, is_countdown=False, is_final=False):
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Get per-profile generation metrics, cancellation latency and model warm-up state"""
+    return jsonify({
+        "profiles": get_generation_metrics(),
+        "cancellation": get_cancellation_metrics(),
+        "warmup": warmup_manager.get_metrics()
+    })
+
+def add_prompt_to_session(session_id, prompt_text, timestamp=None, next_interval=None, is_countdown=False, is_final=False, source="llm"):
     """Helper function to add a prompt to the session with proper metadata"""
     if session_id not in active_sessions:
         return
-        
-    session = active_sessions[session_id]
-    prompt_count = len(session["prompts"])
     
     if timestamp is None:
         timestamp = time.time()
     
-    prompt_data = {
-        "id": prompt_count,
-        "text": prompt_text,
-        "timestamp": timestamp,
-        "is_countdown": is_countdown,
-        "is_final": is_final
-    }
-    
-    if next_interval is not None:
-        prompt_data["next_interval"] = next_interval
-        
-    session["prompts"].append(prompt_data)
-    return prompt_count
+    # Only the session's generator thread writes to its prompt log
+    return active_sessions[session_id]["prompt_log"].append(
+        prompt_text,
+        timestamp,
+        next_interval=next_interval,
+        is_countdown=is_countdown,
+        is_final=is_final,
+        source=source  # "llm", "fallback" or "error"
+    )
 
 def prompt_generation_loop(session_id):
     """Background task to generate prompts at dynamic intervals"""
     session = active_sessions[session_id]
     config = session["config"]
+    cancel_token = session["cancel_token"]
     
-    # Get settings
-    session_duration = config.get("session_duration", 15) * 60  # minutes to seconds
-    min_interval = config.get("min_prompt_interval", 60)  # minimum seconds between prompts
-    
-    start_time = time.time()
-    end_time = start_time + session_duration
-    last_prompt_time = start_time
-    prompt_count = 0
-    
-    # Main prompt generation loop
+    # Setup runs inside the try so a bad config still ends the session cleanly
+    # (and releases its hold on the warm-up manager)
     try:
+        # Get settings
+        session_duration = config.get("session_duration", 15) * 60  # minutes to seconds
+        min_interval = config.get("min_prompt_interval", 60)  # minimum seconds between prompts
+        
+        start_time = time.time()
+        end_time = start_time + session_duration
+        last_prompt_time = start_time
+        prompt_count = 0
+        
+        # Main prompt generation loop
         while time.time() < end_time and session["active"]:
             current_time = time.time()
             time_since_last = current_time - last_prompt_time
@@ -174,18 +194,20 @@ def prompt_generation_loop(session_id):
                     # Check if we've reached the end of the countdown
                     if current_number <= session["countdown_end"]:
                         # Generate final countdown message
-                        final_text = generate_countdown_number(
+                        final_text, source = generate_countdown_number(
                             config["character"], 
                             config["theme"], 
                             current_number,
-                            is_final=True
+                            is_final=True,
+                            cancel_token=cancel_token
                         )
                         add_prompt_to_session(
                             session_id, 
                             final_text, 
                             timestamp=current_time, 
                             is_countdown=True,
-                            is_final=True
+                            is_final=True,
+                            source=source
                         )
                         
                         # End the session
@@ -194,10 +216,11 @@ def prompt_generation_loop(session_id):
                         break
                     
                     # Generate the next countdown number
-                    countdown_text = generate_countdown_number(
+                    countdown_text, source = generate_countdown_number(
                         config["character"], 
                         config["theme"], 
-                        current_number
+                        current_number,
+                        cancel_token=cancel_token
                     )
                     
                     add_prompt_to_session(
@@ -205,15 +228,16 @@ def prompt_generation_loop(session_id):
                         countdown_text, 
                         timestamp=current_time, 
                         next_interval=1,
-                        is_countdown=True
+                        is_countdown=True,
+                        source=source
                     )
                     
                     # Update for next countdown step
                     session["countdown_current"] = current_number - 1
                     last_prompt_time = current_time
                 
-                # Short sleep to prevent CPU hogging during countdown
-                time.sleep(0.1)
+                # Short sleep to prevent CPU hogging during countdown (wakes on stop)
+                cancel_token.wait(0.1)
                 continue
             
             # Only generate regular prompts if minimum time has passed
@@ -225,14 +249,28 @@ def prompt_generation_loop(session_id):
                 # Calculate time elapsed and remaining
                 time_elapsed = current_time - start_time
                 
-                prompt_text, next_interval, is_countdown, countdown_from = generate_prompt_with_timing(
+                # Note whether the model is already loaded for the first prompt
+                if prompt_count == 0:
+                    profile_name = "countdown_start" if time_remaining <= 45 else "prompt"
+                    was_warm = warmup_manager.is_warm(GENERATION_PROFILES[profile_name])
+                    generation_start = time.perf_counter()
+                
+                prompt_text, next_interval, is_countdown, countdown_from, source = generate_prompt_with_timing(
                     character=character,
                     theme=theme,
                     prompt_number=prompt_count+1,
                     time_elapsed=time_elapsed,
-                    time_remaining=time_remaining
+                    time_remaining=time_remaining,
+                    cancel_token=cancel_token
                 )
                 
+                if prompt_count == 0:
+                    record_first_prompt(
+                        time.perf_counter() - generation_start, 
+                        was_warm, 
+                        fell_back=source != "llm"
+                    )
+                
                 # Check if this starts a countdown
                 if is_countdown and countdown_from is not None:
                     # Set up countdown state
@@ -251,7 +289,8 @@ def prompt_generation_loop(session_id):
                     prompt_text, 
                     timestamp=current_time, 
                     next_interval=next_interval,
-                    is_countdown=is_countdown
+                    is_countdown=is_countdown,
+                    source=source
                 )
                 
                 prompt_count += 1
@@ -262,40 +301,60 @@ def prompt_generation_loop(session_id):
                 sleep_duration = max(0, sleep_until - time.time())
                 
                 if sleep_duration > 0 and session["active"]:
-                    time.sleep(sleep_duration)
+                    cancel_token.wait(sleep_duration)
             else:
-                # Small sleep to prevent CPU hogging
-                time.sleep(0.1)
+                # Small sleep to prevent CPU hogging (wakes on stop)
+                cancel_token.wait(0.1)
         
         # If session ended without a proper countdown conclusion, 
         # add a final message anyway to ensure closure
         if session["active"]:  # Normal time expiration
             # Generate a final message
-            final_message = generate_final_message(config["character"], config["theme"])
+            final_message, source = generate_final_message(
+                config["character"], 
+                config["theme"], 
+                cancel_token=cancel_token
+            )
             add_prompt_to_session(
                 session_id, 
                 final_message, 
                 timestamp=time.time(), 
-                is_final=True
+                is_final=True,
+                source=source
             )
         
         # Mark session as complete
         session["active"] = False
         
+    except GenerationCancelled:
+        # Stopped while a request was in flight; the connection is already closed
+        session["active"] = False
+        
     except Exception as e:
         print(f"Error in prompt generation loop: {e}")
-        # Add an error message to the prompts
+        # Add an error message to the prompts; tagged "error" so it is kept out
+        # of the llm/fallback accounting
         add_prompt_to_session(
             session_id,
             "Sorry, an error occurred during prompt generation.",
-            timestamp=time.time()
+            timestamp=time.time(),
+            source="error"
         )
         # Mark session as complete
         session["active"] = False
+    
+    finally:
+        # Measure how quickly a stopped session released its thread and connections
+        cancel_token.mark_released()
+        # Let the models unload once no sessions are running
+        warmup_manager.session_ended()
 
 if __name__ == '__main__':
     # Ensure data directory exists
     os.makedirs('data', exist_ok=True)
     
+    # Preload the configured models so the first prompt doesn't pay the load cost
+    warmup_manager.warm_up()
+    
     # Start server
     app.run(debug=True, port=5000)
\ No newline at end of file
@@ -0,0 +1,131 @@
+import random
+from typing import Dict, Optional, Tuple
+
+# Phrase banks used to assemble fallback messages. Placeholders are filled from
+# the character and theme fields: {name} and {theme}.
+PROMPT_TEMPLATES = [
+    "{opener} {name} {action} {detail}",
+    "{name} {action} {detail} {closer}",
+    "{opener} Write about how {name} {action} {detail}"
+]
+
+OPENERS = [
+    "Take a breath.",
+    "Keep going.",
+    "Focus now.",
+    "Let's shift things a little.",
+    "Stay with it."
+]
+
+ACTIONS = [
+    "notices something unexpected",
+    "makes a decision that can't be undone",
+    "remembers a promise",
+    "takes control of the moment",
+    "slows everything down",
+    "raises the stakes"
+]
+
+DETAILS = [
+    "that fits the spirit of {theme}.",
+    "and {theme} takes on a new meaning.",
+    "while the tension of {theme} builds.",
+    "in a way that echoes {theme}.",
+    "and nothing about {theme} feels the same."
+]
+
+CLOSERS = [
+    "Describe it slowly.",
+    "Show, don't tell.",
+    "Make every word count.",
+    "Don't rush it.",
+    "Let the moment breathe."
+]
+
+COUNTDOWN_INTROS = [
+    "{name} leans in: we're nearing the end. I'll count down from {number}.",
+    "Almost there. {name} begins the countdown from {number}.",
+    "Time to finish this. Counting down from {number}, starting now."
+]
+
+COUNTDOWN_TICKS = [
+    "{number}",
+    "{number}...",
+    "{number}. Steady.",
+    "{number}. Not yet.",
+    "{number}. Stay focused."
+]
+
+COUNTDOWN_FINALS = [
+    "{number}. That's where {name} stops the count. We're done here.",
+    "{number}. Stop. {name} has the final word, and the session is over.",
+    "{number}. And that's the end of it."
+]
+
+FINAL_MESSAGES = [
+    "That's all for this session. {name} is proud of what you wrote.",
+    "Time's up. Put the pen down and let {theme} rest for now.",
+    "The session is over. {name} will be waiting for the next one."
+]
+
+# Interval suggestions (seconds) for fallback prompts
+FALLBACK_INTERVALS = [30, 40, 45, 60]
+
+def _fields(character: Dict[str, str], theme: Dict[str, str]) -> Dict[str, str]:
+    """Get the placeholder values for the templates from character and theme"""
+    return {
+        "name": character.get("name") or "Your character",
+        "theme": theme.get("theme_name") or "the story"
+    }
+
+def fallback_prompt(character: Dict[str, str],
+                    theme: Dict[str, str],
+                    time_remaining: float,
+                    rng: Optional[random.Random] = None) -> Tuple[str, int, bool, Optional[int]]:
+    """
+    Build a writing prompt locally without calling the LLM
+
+    Args:
+        character: Dictionary containing character definition fields
+        theme: Dictionary containing theme information
+        time_remaining: Time remaining in session in seconds
+        rng: Optional random generator (for reproducible output)
+
+    Returns:
+        Tuple of (prompt_text, next_interval_in_seconds, is_countdown, countdown_from),
+        matching generate_prompt_with_timing
+    """
+    rng = rng or random
+    fields = _fields(character, theme)
+
+    # Near the end of the session, start the countdown instead
+    if time_remaining <= 45:
+        countdown_from = rng.randint(10, 20)
+        text = rng.choice(COUNTDOWN_INTROS).format(number=countdown_from, **fields)
+        return text, 1, True, countdown_from
+
+    text = rng.choice(PROMPT_TEMPLATES).format(
+        opener=rng.choice(OPENERS),
+        action=rng.choice(ACTIONS),
+        detail=rng.choice(DETAILS).format(**fields),
+        closer=rng.choice(CLOSERS),
+        **fields
+    )
+    return text, rng.choice(FALLBACK_INTERVALS), False, None
+
+def fallback_countdown_number(character: Dict[str, str],
+                              theme: Dict[str, str],
+                              number: int,
+                              is_final: bool = False,
+                              rng: Optional[random.Random] = None) -> str:
+    """Build a countdown message locally without calling the LLM"""
+    rng = rng or random
+    templates = COUNTDOWN_FINALS if is_final else COUNTDOWN_TICKS
+    return rng.choice(templates).format(number=number, **_fields(character, theme))
+
+def fallback_final_message(character: Dict[str, str],
+                           theme: Dict[str, str],
+                           rng: Optional[random.Random] = None) -> str:
+    """Build a final session message locally without calling the LLM"""
+    rng = rng or random
+    return rng.choice(FINAL_MESSAGES).format(**_fields(character, theme))
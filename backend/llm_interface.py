@@ -2,19 +2,577 @@ import requests
 import json
 import os
 import re
+import socket
+import threading
+import time
 from typing import Dict, Any, Optional, Tuple, List
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ReadTimeoutError
+from fallback_generator import (
+    fallback_prompt,
+    fallback_countdown_number,
+    fallback_final_message
+)
 
 # Configuration variables for different LLM backends
 LLM_BACKEND = os.environ.get("LLM_BACKEND", "lmstudio")  # Options: lmstudio, ollama
 LLM_HOST = os.environ.get("LLM_HOST", "http://localhost:1234")  # Default for LMStudio
 LLM_MODEL = os.environ.get("LLM_MODEL", "mistral")  # Default model name
 
+# Optional small, fast model for short latency-critical messages (countdown ticks)
+LLM_FAST_BACKEND = os.environ.get("LLM_FAST_BACKEND", LLM_BACKEND)
+LLM_FAST_HOST = os.environ.get("LLM_FAST_HOST", LLM_HOST)
+LLM_FAST_MODEL = os.environ.get("LLM_FAST_MODEL")  # None = backend's default model
+
+# Generation profiles for each kind of call. A model of None means the backend's
+# default (LLM_MODEL for Ollama, the currently loaded model for LMStudio).
+# "deadline" is the number of seconds a call may take before the local
+# fallback generator is used instead.
+GENERATION_PROFILES: Dict[str, Dict[str, Any]] = {
+    "prompt": {
+        "backend": LLM_BACKEND,
+        "host": LLM_HOST,
+        "model": None,
+        "max_tokens": 250,
+        "temperature": 0.7,
+        "top_p": 0.95,
+        "deadline": 20,
+        "stop": []
+    },
+    "countdown_start": {
+        "backend": LLM_BACKEND,
+        "host": LLM_HOST,
+        "model": None,
+        "max_tokens": 120,
+        "temperature": 0.7,
+        "top_p": 0.95,
+        "deadline": 15,
+        "stop": []
+    },
+    "countdown_tick": {
+        "backend": LLM_FAST_BACKEND,
+        "host": LLM_FAST_HOST,
+        "model": LLM_FAST_MODEL,
+        "max_tokens": 24,
+        "temperature": 0.9,
+        "top_p": 0.95,
+        "deadline": 0.9,
+        "stop": ["\n"]
+    },
+    "final": {
+        "backend": LLM_BACKEND,
+        "host": LLM_HOST,
+        "model": None,
+        "max_tokens": 80,
+        "temperature": 0.8,
+        "top_p": 0.95,
+        "deadline": 10,
+        "stop": ["\n\n"]
+    }
+}
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+# Validation for each overridable profile field: (check, expected value description)
+PROFILE_FIELD_CHECKS = {
+    "backend": (lambda v: v in ("lmstudio", "ollama"), '"lmstudio" or "ollama"'),
+    "host": (lambda v: isinstance(v, str) and bool(v), "a non-empty string"),
+    "model": (lambda v: v is None or (isinstance(v, str) and bool(v)), "a non-empty string or null"),
+    "max_tokens": (lambda v: isinstance(v, int) and not isinstance(v, bool) and v > 0, "a positive integer"),
+    "temperature": (lambda v: _is_number(v) and v >= 0, "a non-negative number"),
+    "top_p": (lambda v: _is_number(v) and 0 < v <= 1, "a number in (0, 1]"),
+    "deadline": (lambda v: _is_number(v) and v > 0, "a positive number of seconds"),
+    "stop": (lambda v: isinstance(v, list) and all(isinstance(x, str) for x in v), "a list of strings")
+}
+
+def _load_profile_overrides() -> None:
+    """
+    Apply profile overrides from the LLM_PROFILES environment variable
+    
+    LLM_PROFILES holds a JSON object mapping profile names to the fields to
+    override, e.g. {"countdown_tick": {"model": "qwen2.5:0.5b", "max_tokens": 16}}
+    """
+    raw = os.environ.get("LLM_PROFILES")
+    if not raw:
+        return
+    
+    try:
+        overrides = json.loads(raw)
+    except ValueError as e:
+        print(f"Error parsing LLM_PROFILES: {e}")
+        return
+    
+    if not isinstance(overrides, dict):
+        print("Ignoring LLM_PROFILES: expected a JSON object of profile overrides")
+        return
+    
+    for name, fields in overrides.items():
+        if name not in GENERATION_PROFILES:
+            print(f"Ignoring unknown generation profile: {name}")
+            continue
+        if not isinstance(fields, dict):
+            print(f"Ignoring generation profile override for {name}: expected a JSON object")
+            continue
+        for field, value in fields.items():
+            if field not in PROFILE_FIELD_CHECKS:
+                print(f"Ignoring unknown field in generation profile {name}: {field}")
+                continue
+            check, expected = PROFILE_FIELD_CHECKS[field]
+            if not check(value):
+                print(f"Ignoring {name}.{field} override {value!r}: expected {expected}")
+                continue
+            GENERATION_PROFILES[name][field] = value
+
+_load_profile_overrides()
+
+# Warm-up and keep-alive settings. While sessions are active, models are kept
+# resident with Ollama's keep_alive and periodic cheap probes; once idle they
+# are left to unload on the backend's own schedule.
+LLM_KEEP_ALIVE = os.environ.get("LLM_KEEP_ALIVE", "10m")  # Ollama keep_alive during sessions
+KEEPALIVE_PROBE_INTERVAL = float(os.environ.get("LLM_KEEPALIVE_PROBE_INTERVAL", 120))  # seconds
+MODEL_IDLE_TIMEOUT = float(os.environ.get("LLM_MODEL_IDLE_TIMEOUT", 300))  # seconds unused before a model counts as cold
+WARMUP_TIMEOUT = float(os.environ.get("LLM_WARMUP_TIMEOUT", 120))  # model loads can be slow
+
+# Circuit breaker settings: after this many consecutive hard failures
+# (connection errors, HTTP errors, bad responses - not deadline misses) a backend is
+# skipped for CIRCUIT_RESET_TIMEOUT seconds before a single trial call is allowed
+CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get("LLM_CIRCUIT_FAILURE_THRESHOLD", 3))
+CIRCUIT_RESET_TIMEOUT = float(os.environ.get("LLM_CIRCUIT_RESET_TIMEOUT", 30))
+
+# Sources recorded for each delivered message
+SOURCE_LLM = "llm"
+SOURCE_FALLBACK = "fallback"
+
+class LLMUnavailableError(Exception):
+    """Raised when an LLM call fails, misses its deadline or its circuit is open"""
+
+class GenerationCancelled(Exception):
+    """Raised when a generation is aborted because its session was stopped"""
+
+class CancellationToken:
+    """
+    Cooperative cancellation for one session's generation
+    
+    cancel() wakes any wait() at once and shuts down the sockets of in-flight
+    requests - including ones still waiting for response headers - which
+    drops the connection so the backend stops generating.
+    """
+    
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._sockets: List[socket.socket] = []
+        self.cancelled_at: Optional[float] = None
+    
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+    
+    def wait(self, timeout: float) -> bool:
+        """Sleep for up to timeout seconds; returns True if cancelled"""
+        return self._event.wait(timeout)
+    
+    def cancel(self) -> None:
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.cancelled_at = time.perf_counter()
+            self._event.set()
+            sockets, self._sockets = self._sockets, []
+        for sock in sockets:
+            _shutdown_socket(sock)
+    
+    def register_socket(self, sock: socket.socket) -> None:
+        """Track a freshly connected socket so cancel() can abort its request"""
+        with self._lock:
+            if not self._event.is_set():
+                self._sockets.append(sock)
+                return
+        # Already cancelled: the request fails as soon as it tries to send
+        _shutdown_socket(sock)
+    
+    def release_sockets(self) -> None:
+        """Forget the sockets of a request that has finished"""
+        with self._lock:
+            self._sockets = []
+    
+    def mark_released(self) -> None:
+        """Record how long the session took to release its resources after cancel()"""
+        if self.cancelled_at is not None:
+            _record_cancellation(time.perf_counter() - self.cancelled_at)
+
+class ModelWarmupManager:
+    """
+    Preloads the configured models and keeps them resident while sessions are active
+    
+    A model is identified by (backend, host, model) as resolved from
+    GENERATION_PROFILES, so profiles sharing a model are warmed only once.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last_used: Dict[Tuple[str, str, Optional[str]], float] = {}
+        self._probing: set = set()
+        self._active_sessions = 0
+        self._keepalive_thread: Optional[threading.Thread] = None
+        self._wake = threading.Event()
+        self.probes = 0
+        self.probe_failures = 0
+    
+    @staticmethod
+    def target_for(profile: Dict[str, Any]) -> Tuple[str, str, Optional[str]]:
+        """Resolve the (backend, host, model) a profile generates with"""
+        model = profile["model"]
+        if model is None and profile["backend"] == "ollama":
+            model = LLM_MODEL
+        return profile["backend"], profile["host"], model
+    
+    def targets(self) -> List[Tuple[str, str, Optional[str]]]:
+        """Distinct models used by the generation profiles"""
+        return list(dict.fromkeys(self.target_for(p) for p in GENERATION_PROFILES.values()))
+    
+    @property
+    def sessions_active(self) -> bool:
+        return self._active_sessions > 0
+    
+    def mark_used(self, profile: Dict[str, Any]) -> None:
+        """Note that a profile's model just served a request (and is therefore loaded)"""
+        with self._lock:
+            self._last_used[self.target_for(profile)] = time.monotonic()
+    
+    def is_warm(self, profile: Dict[str, Any]) -> bool:
+        """Whether a profile's model was used recently enough to still be loaded"""
+        with self._lock:
+            last_used = self._last_used.get(self.target_for(profile))
+        return last_used is not None and time.monotonic() - last_used < MODEL_IDLE_TIMEOUT
+    
+    def keep_alive(self) -> Optional[str]:
+        """Ollama keep_alive to send with requests (None = backend default)"""
+        return LLM_KEEP_ALIVE if self.sessions_active else None
+    
+    def warm_up(self) -> None:
+        """Preload every configured model in the background"""
+        for target in self.targets():
+            with self._lock:
+                if target in self._probing:
+                    continue
+                self._probing.add(target)
+            threading.Thread(target=self._probe, args=(target,), daemon=True).start()
+    
+    def session_started(self) -> None:
+        """Warm up the models and keep them resident until sessions end"""
+        with self._lock:
+            self._active_sessions += 1
+            if self._keepalive_thread is None:
+                self._wake.clear()
+                self._keepalive_thread = threading.Thread(target=self._keepalive_loop, daemon=True)
+                self._keepalive_thread.start()
+        self.warm_up()
+    
+    def session_ended(self) -> None:
+        with self._lock:
+            self._active_sessions = max(0, self._active_sessions - 1)
+            if self._active_sessions == 0:
+                self._wake.set()
+    
+    def _keepalive_loop(self) -> None:
+        """Probe models that have not been used recently while sessions are active"""
+        while not self._wake.wait(KEEPALIVE_PROBE_INTERVAL):
+            now = time.monotonic()
+            for target in self.targets():
+                with self._lock:
+                    last_used = self._last_used.get(target)
+                    if target in self._probing or (last_used is not None and now - last_used < KEEPALIVE_PROBE_INTERVAL):
+                        continue
+                    self._probing.add(target)
+                self._probe(target)
+        
+        with self._lock:
+            self._keepalive_thread = None
+            # A session may have started while we were shutting down
+            if self._active_sessions > 0:
+                self._wake.clear()
+                self._keepalive_thread = threading.Thread(target=self._keepalive_loop, daemon=True)
+                self._keepalive_thread.start()
+    
+    def _probe(self, target: Tuple[str, str, Optional[str]]) -> None:
+        """Send the cheapest request that makes the backend load the model"""
+        backend, host, model = target
+        try:
+            if get_circuit_breaker(backend, host).state == "open":
+                return
+            
+            if backend == "ollama":
+                # An empty prompt only loads the model
+                payload = {"model": model, "prompt": "", "stream": False,
+                           "keep_alive": LLM_KEEP_ALIVE}
+                url = f"{host}/api/generate"
+            elif backend == "lmstudio":
+                payload = {"messages": [{"role": "user", "content": "Hi"}],
+                           "max_tokens": 1, "stream": False}
+                if model:
+                    payload["model"] = model
+                url = f"{host}/v1/chat/completions"
+            else:
+                return
+            
+            self.probes += 1
+            response = requests.post(url, json=payload, timeout=WARMUP_TIMEOUT)
+            response.raise_for_status()
+            with self._lock:
+                self._last_used[target] = time.monotonic()
+        except Exception as e:
+            self.probe_failures += 1
+            print(f"Error warming up {backend} model {model}: {e}")
+        finally:
+            with self._lock:
+                self._probing.discard(target)
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        """Get warm-up state and cold versus warm first-prompt latency"""
+        with _metrics_lock:
+            first_prompt = {
+                state: {
+                    "count": stats["count"],
+                    "avg_latency_ms": round(stats["total_latency"] / stats["count"] * 1000, 1) if stats["count"] else 0,
+                    "max_latency_ms": round(stats["max_latency"] * 1000, 1),
+                    "fallbacks": stats["fallbacks"],
+                    "fallback_avg_latency_ms": round(stats["fallback_total_latency"] / stats["fallbacks"] * 1000, 1) if stats["fallbacks"] else 0,
+                    "fallback_max_latency_ms": round(stats["fallback_max_latency"] * 1000, 1)
+                }
+                for state, stats in _first_prompt_metrics.items()
+            }
+        
+        models = []
+        for backend, host, model in self.targets():
+            profile = {"backend": backend, "host": host, "model": model}
+            models.append({"backend": backend, "host": host, "model": model, "warm": self.is_warm(profile)})
+        
+        return {
+            "active_sessions": self._active_sessions,
+            "probes": self.probes,
+            "probe_failures": self.probe_failures,
+            "models": models,
+            "first_prompt": first_prompt
+        }
+
+warmup_manager = ModelWarmupManager()
+
+def _shutdown_socket(sock: socket.socket) -> None:
+    """Shut a socket down, waking any thread blocked on it (closing alone does not)"""
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+# Callback for the request being made on the current thread, called with the
+# socket as soon as the connection connects
+_connect_context = threading.local()
+
+class _CancellableConnectionMixin:
+    def connect(self):
+        super().connect()
+        on_connect = getattr(_connect_context, "on_connect", None)
+        if on_connect is not None:
+            on_connect(self.sock)
+
+class _CancellableHTTPConnection(_CancellableConnectionMixin, HTTPConnection):
+    pass
+
+class _CancellableHTTPSConnection(_CancellableConnectionMixin, HTTPSConnection):
+    pass
+
+class _CancellableHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _CancellableHTTPConnection
+
+class _CancellableHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _CancellableHTTPSConnection
+
+class _CancellableAdapter(HTTPAdapter):
+    """Transport adapter whose connections hand their socket to the current request"""
+    
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _CancellableHTTPConnectionPool,
+            "https": _CancellableHTTPSConnectionPool
+        }
+
+class CircuitBreaker:
+    """Tracks consecutive failures of one backend and short-circuits calls to it"""
+    
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+    
+    @property
+    def state(self) -> str:
+        """Current state: closed, open or half_open"""
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+    
+    def allow_request(self) -> bool:
+        """Check whether a call may be attempted; allows one trial call when half open"""
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+    
+    def release_trial(self) -> None:
+        """Give back a trial call that ended without a verdict (e.g. cancelled)"""
+        with self._lock:
+            self._trial_in_flight = False
+    
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+    
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+# One circuit breaker per (backend, host)
+_breakers_lock = threading.Lock()
+_circuit_breakers: Dict[Tuple[str, str], CircuitBreaker] = {}
+
+def get_circuit_breaker(backend: str, host: str) -> CircuitBreaker:
+    """Get (or create) the circuit breaker for a backend"""
+    with _breakers_lock:
+        key = (backend, host)
+        if key not in _circuit_breakers:
+            _circuit_breakers[key] = CircuitBreaker(CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT)
+        return _circuit_breakers[key]
+
+# Per-profile generation metrics (tokens generated, latency and fallback usage)
+_metrics_lock = threading.Lock()
+_profile_metrics: Dict[str, Dict[str, float]] = {
+    name: {"calls": 0, "errors": 0, "deadline_misses": 0, "fallbacks": 0,
+           "tokens": 0, "total_latency": 0.0, "max_latency": 0.0}
+    for name in GENERATION_PROFILES
+}
+
+def _record_call(profile_name: str, latency: float, tokens: int, error: bool = False,
+                 deadline_missed: bool = False) -> None:
+    """Record the outcome of a single LLM call against its profile"""
+    with _metrics_lock:
+        stats = _profile_metrics[profile_name]
+        stats["calls"] += 1
+        stats["tokens"] += tokens
+        stats["total_latency"] += latency
+        stats["max_latency"] = max(stats["max_latency"], latency)
+        if error:
+            stats["errors"] += 1
+        if deadline_missed:
+            stats["deadline_misses"] += 1
+
+def _record_fallback(profile_name: str) -> None:
+    """Record that the fallback generator was used for a profile"""
+    with _metrics_lock:
+        _profile_metrics[profile_name]["fallbacks"] += 1
+
+# Time from stop request to the session releasing its thread and connections
+_cancel_metrics = {"count": 0, "total_latency": 0.0, "max_latency": 0.0}
+
+def _record_cancellation(latency: float) -> None:
+    with _metrics_lock:
+        _cancel_metrics["count"] += 1
+        _cancel_metrics["total_latency"] += latency
+        _cancel_metrics["max_latency"] = max(_cancel_metrics["max_latency"], latency)
+
+# First-prompt latency of each session, split by whether the model was warm
+_first_prompt_metrics = {
+    state: {"count": 0, "total_latency": 0.0, "max_latency": 0.0,
+            "fallbacks": 0, "fallback_total_latency": 0.0, "fallback_max_latency": 0.0}
+    for state in ("cold", "warm")
+}
+
+def record_first_prompt(latency: float, was_warm: bool, fell_back: bool = False) -> None:
+    """
+    Record the latency of a session's first prompt
+    
+    Fallback first prompts are kept in their own fields: a deadline miss while
+    the model loads takes the full deadline, but an open circuit or refused
+    connection falls back almost instantly, so mixing them into the LLM
+    latency would skew it either way.
+    """
+    with _metrics_lock:
+        stats = _first_prompt_metrics["warm" if was_warm else "cold"]
+        if fell_back:
+            stats["fallbacks"] += 1
+            stats["fallback_total_latency"] += latency
+            stats["fallback_max_latency"] = max(stats["fallback_max_latency"], latency)
+        else:
+            stats["count"] += 1
+            stats["total_latency"] += latency
+            stats["max_latency"] = max(stats["max_latency"], latency)
+
+def get_cancellation_metrics() -> Dict[str, Any]:
+    """Get a snapshot of session cancellation latency"""
+    with _metrics_lock:
+        stats = dict(_cancel_metrics)
+    count = stats["count"]
+    return {
+        "cancellations": count,
+        "avg_latency_ms": round(stats["total_latency"] / count * 1000, 2) if count else 0,
+        "max_latency_ms": round(stats["max_latency"] * 1000, 2)
+    }
+
+def get_generation_metrics() -> Dict[str, Dict[str, Any]]:
+    """
+    Get a snapshot of generation metrics for each profile
+    
+    Returns:
+        Dictionary mapping profile name to call counts, tokens generated and latency
+    """
+    with _metrics_lock:
+        snapshot = {name: dict(stats) for name, stats in _profile_metrics.items()}
+    
+    metrics = {}
+    for name, stats in snapshot.items():
+        calls = stats["calls"]
+        profile = GENERATION_PROFILES[name]
+        metrics[name] = {
+            "backend": profile["backend"],
+            "model": profile["model"],
+            "calls": calls,
+            "errors": stats["errors"],
+            "deadline_misses": stats["deadline_misses"],
+            "fallbacks": stats["fallbacks"],
+            "circuit": get_circuit_breaker(profile["backend"], profile["host"]).state,
+            "tokens_generated": stats["tokens"],
+            "avg_tokens": round(stats["tokens"] / calls, 1) if calls else 0,
+            "avg_latency_ms": round(stats["total_latency"] / calls * 1000, 1) if calls else 0,
+            "max_latency_ms": round(stats["max_latency"] * 1000, 1),
+            "tokens_per_second": round(stats["tokens"] / stats["total_latency"], 1) if stats["total_latency"] else 0
+        }
+    return metrics
+
 def generate_prompt_with_timing(character: Dict[str, str], 
                                 theme: Dict[str, str], 
                                 prompt_number: int, 
                                 time_elapsed: float, 
                                 time_remaining: float,
-                                total_prompts: int = None) -> Tuple[str, int, bool, Optional[int]]:
+                                total_prompts: int = None,
+                                cancel_token: Optional[CancellationToken] = None) -> Tuple[str, int, bool, Optional[int], str]:
     """
     Generate a creative writing prompt with a suggested timing for the next prompt
     
@@ -25,13 +583,15 @@ def generate_prompt_with_timing(character: Dict[str, str],
         time_elapsed: Time elapsed since session start in seconds
         time_remaining: Time remaining in session in seconds
         total_prompts: Optional estimate of total prompts in session
+        cancel_token: Optional token used to abort the generation
         
     Returns:
-        Tuple of (prompt_text, next_interval_in_seconds, is_countdown, countdown_from)
+        Tuple of (prompt_text, next_interval_in_seconds, is_countdown, countdown_from, source)
         - prompt_text: The generated prompt
         - next_interval_in_seconds: Time until next prompt
         - is_countdown: Boolean indicating if this is part of a countdown
         - countdown_from: If starting a countdown, what number to count from (None otherwise)
+        - source: "llm", or "fallback" if the local fallback generator was used
     """
     # Check if we're near the end of the session (less than 45 seconds remaining)
     is_near_end = time_remaining <= 45
@@ -112,13 +672,14 @@ FORMAT YOUR RESPONSE LIKE THIS:
     else:
         user_prompt = f"Generate writing prompt #{prompt_number} with appropriate timing."
     
-    # Call appropriate LLM backend
-    if LLM_BACKEND == "lmstudio":
-        response = call_lmstudio(system_prompt, user_prompt)
-    elif LLM_BACKEND == "ollama":
-        response = call_ollama(system_prompt, user_prompt)
-    else:
-        raise ValueError(f"Unsupported LLM backend: {LLM_BACKEND}")
+    # Call the LLM with the profile for this kind of message
+    profile_name = "countdown_start" if is_near_end else "prompt"
+    try:
+        response = call_llm(profile_name, system_prompt, user_prompt, cancel_token)
+    except LLMUnavailableError as e:
+        print(f"Using fallback prompt: {e}")
+        _record_fallback(profile_name)
+        return fallback_prompt(character, theme, time_remaining) + (SOURCE_FALLBACK,)
     
     # Parse response to extract prompt and timing
     prompt_text = "Failed to generate prompt."
@@ -164,12 +725,13 @@ FORMAT YOUR RESPONSE LIKE THIS:
         # If everything fails, use the raw response and default interval
         prompt_text = response.strip()
     
-    return prompt_text, next_interval, is_countdown, countdown_from
+    return prompt_text, next_interval, is_countdown, countdown_from, SOURCE_LLM
 
 def generate_countdown_number(character: Dict[str, str],
                              theme: Dict[str, str],
                              number: int,
-                             is_final: bool = False) -> str:
+                             is_final: bool = False,
+                             cancel_token: Optional[CancellationToken] = None) -> Tuple[str, str]:
     """
     Generate a countdown number with optional message
     
@@ -178,9 +740,10 @@ def generate_countdown_number(character: Dict[str, str],
         theme: Dictionary containing theme information
         number: The current countdown number
         is_final: Whether this is the final message (0 or chosen end number)
+        cancel_token: Optional token used to abort the generation
         
     Returns:
-        String containing the countdown number and optional message
+        Tuple of (countdown_text, source) where source is "llm" or "fallback"
     """
     if is_final:
         system_prompt = f"""You are a creative writing prompt generator creating a final message for a countdown sequence.
@@ -229,18 +792,20 @@ Your response should ONLY include the countdown message text.
 """
         user_prompt = f"Generate countdown text for number {number}."
     
-    # Call appropriate LLM backend
-    if LLM_BACKEND == "lmstudio":
-        response = call_lmstudio(system_prompt, user_prompt)
-    elif LLM_BACKEND == "ollama":
-        response = call_ollama(system_prompt, user_prompt)
-    else:
-        raise ValueError(f"Unsupported LLM backend: {LLM_BACKEND}")
+    # Call the LLM with the profile for this kind of message
+    profile_name = "final" if is_final else "countdown_tick"
+    try:
+        response = call_llm(profile_name, system_prompt, user_prompt, cancel_token)
+    except LLMUnavailableError as e:
+        print(f"Using fallback countdown text: {e}")
+        _record_fallback(profile_name)
+        return fallback_countdown_number(character, theme, number, is_final), SOURCE_FALLBACK
     
-    return response.strip()
+    return response.strip(), SOURCE_LLM
 
-def generate_final_message(character: Dict[str, str], theme: Dict[str, str]) -> str:
-    """Generate a final message for the session"""
+def generate_final_message(character: Dict[str, str], theme: Dict[str, str],
+                           cancel_token: Optional[CancellationToken] = None) -> Tuple[str, str]:
+    """Generate a final message for the session, returning (text, source)"""
     system_prompt = f"""You are a creative writing prompt generator creating a final message to conclude a writing session.
 
 CHARACTER INFORMATION:
@@ -262,61 +827,248 @@ Your response should ONLY include the final message text.
 """
     user_prompt = "Generate the final message to conclude the writing session."
     
-    # Call appropriate LLM backend
-    if LLM_BACKEND == "lmstudio":
-        response = call_lmstudio(system_prompt, user_prompt)
-    elif LLM_BACKEND == "ollama":
-        response = call_ollama(system_prompt, user_prompt)
+    # Call the LLM with the profile for this kind of message
+    try:
+        response = call_llm("final", system_prompt, user_prompt, cancel_token)
+    except LLMUnavailableError as e:
+        print(f"Using fallback final message: {e}")
+        _record_fallback("final")
+        return fallback_final_message(character, theme), SOURCE_FALLBACK
+    
+    return response.strip(), SOURCE_LLM
+
+def call_llm(profile_name: str, system_prompt: str, user_prompt: str,
+             cancel_token: Optional[CancellationToken] = None) -> str:
+    """
+    Call the LLM backend configured for a generation profile
+    
+    Args:
+        profile_name: Key into GENERATION_PROFILES (prompt, countdown_start, countdown_tick, final)
+        system_prompt: System prompt text
+        user_prompt: User prompt text
+        cancel_token: Optional token used to abort the request while in flight
+        
+    Returns:
+        The generated text
+        
+    Raises:
+        LLMUnavailableError: If the call failed, missed the profile's deadline,
+            returned an empty completion, or the backend's circuit breaker is open
+        GenerationCancelled: If the token was cancelled before or during the call
+    """
+    profile = GENERATION_PROFILES[profile_name]
+    backend = profile["backend"]
+    
+    if backend == "lmstudio":
+        call_backend = call_lmstudio
+    elif backend == "ollama":
+        call_backend = call_ollama
     else:
-        raise ValueError(f"Unsupported LLM backend: {LLM_BACKEND}")
+        raise ValueError(f"Unsupported LLM backend: {backend}")
+    
+    if cancel_token is not None and cancel_token.cancelled:
+        raise GenerationCancelled()
+    
+    breaker = get_circuit_breaker(backend, profile["host"])
+    if not breaker.allow_request():
+        raise LLMUnavailableError(f"Circuit open for {backend} at {profile['host']}")
+    
+    start = time.perf_counter()
+    try:
+        text, tokens = call_backend(system_prompt, user_prompt, profile, cancel_token)
+    except GenerationCancelled:
+        # Not the backend's fault: let a pending trial call be retried
+        breaker.release_trial()
+        raise
+    except requests.exceptions.Timeout as e:
+        # A slow backend is not a broken one: deadline misses fall back for this
+        # call only and don't open the circuit for every profile sharing the host
+        if isinstance(e, requests.exceptions.ConnectTimeout):
+            breaker.record_failure()
+        else:
+            breaker.release_trial()
+        _record_call(profile_name, time.perf_counter() - start, 0, error=True, deadline_missed=True)
+        raise LLMUnavailableError(f"{backend} missed the {profile['deadline']}s deadline for '{profile_name}'") from e
+    except Exception as e:
+        if cancel_token is not None and cancel_token.cancelled:
+            # The read failed because cancel() closed the connection
+            breaker.release_trial()
+            raise GenerationCancelled() from e
+        breaker.record_failure()
+        _record_call(profile_name, time.perf_counter() - start, 0, error=True)
+        raise LLMUnavailableError(f"Error calling {backend} for profile '{profile_name}': {e}") from e
+    
+    latency = time.perf_counter() - start
+    breaker.record_success()
+    warmup_manager.mark_used(profile)
+    
+    # Small models often open with a newline, which a "\n" stop sequence turns
+    # into an empty reply; the backend is healthy, but the text is unusable
+    if not text.strip():
+        _record_call(profile_name, latency, tokens, error=True)
+        raise LLMUnavailableError(f"{backend} returned an empty completion for '{profile_name}'")
+    
+    _record_call(profile_name, latency, tokens)
+    return text
+
+def _stream_lines(url: str, payload: Dict[str, Any], profile: Dict[str, Any],
+                  cancel_token: Optional[CancellationToken] = None):
+    """
+    POST a streaming request and yield its non-empty lines
+    
+    The profile's deadline is a wall-clock bound on the whole request: a timer
+    shuts the socket down when it expires, whether the request is waiting for
+    headers or for the next token, and the failure is raised as a ReadTimeout.
+    The connection is also shut down as soon as the cancel token fires or the
+    caller stops reading, so the backend stops generating.
+    """
+    sockets: List[socket.socket] = []
+    sockets_lock = threading.Lock()
+    deadline_hit = threading.Event()
     
-    return response.strip()
+    def on_connect(sock: socket.socket) -> None:
+        with sockets_lock:
+            sockets.append(sock)
+        if cancel_token is not None:
+            cancel_token.register_socket(sock)
+        if deadline_hit.is_set():
+            _shutdown_socket(sock)
+    
+    def on_deadline() -> None:
+        deadline_hit.set()
+        with sockets_lock:
+            expired = list(sockets)
+        for sock in expired:
+            _shutdown_socket(sock)
+    
+    timer = threading.Timer(profile["deadline"], on_deadline)
+    timer.daemon = True
+    
+    # A fresh session per request so every request opens its own connection
+    http = requests.Session()
+    adapter = _CancellableAdapter()
+    http.mount("http://", adapter)
+    http.mount("https://", adapter)
+    
+    try:
+        timer.start()
+        _connect_context.on_connect = on_connect
+        try:
+            response = http.post(url, json=payload, stream=True, timeout=profile["deadline"])
+        finally:
+            _connect_context.on_connect = None
+        
+        try:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if cancel_token is not None and cancel_token.cancelled:
+                    raise GenerationCancelled()
+                if line:
+                    yield line.decode("utf-8")
+        finally:
+            response.close()
+    except (GenerationCancelled, requests.exceptions.Timeout):
+        raise
+    except Exception as e:
+        cancelled = cancel_token is not None and cancel_token.cancelled
+        # The deadline timer shut the socket down (surfacing as a connection or
+        # chunked-encoding error), or requests reported a read timeout mid-stream
+        # as a ConnectionError: both are deadline misses, not backend failures
+        timed_out = isinstance(e, requests.exceptions.ConnectionError) and \
+            isinstance(e.args[0] if e.args else None, ReadTimeoutError)
+        if (deadline_hit.is_set() and not cancelled) or timed_out:
+            raise requests.exceptions.ReadTimeout(f"Request exceeded {profile['deadline']}s deadline") from e
+        raise
+    finally:
+        timer.cancel()
+        if cancel_token is not None:
+            cancel_token.release_sockets()
+        http.close()
 
-def call_lmstudio(system_prompt: str, user_prompt: str) -> str:
-    """Call LMStudio API to generate a prompt"""
-    url = f"{LLM_HOST}/v1/chat/completions"
+def call_lmstudio(system_prompt: str, user_prompt: str, profile: Dict[str, Any],
+                  cancel_token: Optional[CancellationToken] = None) -> Tuple[str, int]:
+    """Call LMStudio API and return the generated text and completion token count"""
+    url = f"{profile['host']}/v1/chat/completions"
     
     payload = {
         "messages": [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_prompt}
         ],
-        "temperature": 0.7,
-        "max_tokens": 250,
-        "stream": False
+        "temperature": profile["temperature"],
+        "top_p": profile["top_p"],
+        "max_tokens": profile["max_tokens"],
+        "stream": True,
+        # Ask for the real completion token count in the final chunk
+        "stream_options": {"include_usage": True}
     }
+    if profile["model"]:
+        payload["model"] = profile["model"]
+    if profile["stop"]:
+        payload["stop"] = profile["stop"]
     
-    try:
-        response = requests.post(url, json=payload)
-        response.raise_for_status()
-        result = response.json()
-        return result["choices"][0]["message"]["content"]
-    except Exception as e:
-        print(f"Error calling LMStudio: {e}")
-        return "Sorry, I couldn't generate a prompt at this time."
+    # Server-sent events: "data: {...}" per token, terminated by "data: [DONE]"
+    parts = []
+    chunks = 0
+    usage_tokens = None
+    for line in _stream_lines(url, payload, profile, cancel_token):
+        if not line.startswith("data:"):
+            continue
+        data = line[len("data:"):].strip()
+        if data == "[DONE]":
+            break
+        event = json.loads(data)
+        if event.get("usage"):
+            usage_tokens = event["usage"].get("completion_tokens")
+        for choice in event.get("choices", []):
+            content = choice.get("delta", {}).get("content")
+            if content:
+                parts.append(content)
+                chunks += 1
+    
+    text = "".join(parts)
+    return text, usage_tokens if usage_tokens is not None else chunks
 
-def call_ollama(system_prompt: str, user_prompt: str) -> str:
-    """Call Ollama API to generate a prompt"""
-    url = f"{LLM_HOST}/api/generate"
+def call_ollama(system_prompt: str, user_prompt: str, profile: Dict[str, Any],
+                cancel_token: Optional[CancellationToken] = None) -> Tuple[str, int]:
+    """Call Ollama API and return the generated text and evaluated token count"""
+    url = f"{profile['host']}/api/generate"
     
     # Combine system and user prompts for Ollama
     combined_prompt = f"System: {system_prompt}\n\nUser: {user_prompt}"
     
     payload = {
-        "model": LLM_MODEL,
+        "model": profile["model"] or LLM_MODEL,
         "prompt": combined_prompt,
-        "temperature": 0.7,
-        "max_tokens": 250
+        "stream": True,
+        "options": {
+            "temperature": profile["temperature"],
+            "top_p": profile["top_p"],
+            "num_predict": profile["max_tokens"],
+            "stop": profile["stop"]
+        }
     }
+    keep_alive = warmup_manager.keep_alive()
+    if keep_alive is not None:
+        payload["keep_alive"] = keep_alive
     
-    try:
-        response = requests.post(url, json=payload)
-        response.raise_for_status()
-        result = response.json()
-        return result["response"]
-    except Exception as e:
-        print(f"Error calling Ollama: {e}")
-        return "Sorry, I couldn't generate a prompt at this time."
+    # One JSON object per line; the last one has "done": true and the token count
+    parts = []
+    chunks = 0
+    eval_count = None
+    for line in _stream_lines(url, payload, profile, cancel_token):
+        event = json.loads(line)
+        if event.get("error"):
+            raise RuntimeError(event["error"])
+        if event.get("response"):
+            parts.append(event["response"])
+            chunks += 1
+        if event.get("done"):
+            eval_count = event.get("eval_count")
+            break
+    
+    text = "".join(parts)
+    return text, eval_count if eval_count is not None else chunks
 
 # Simple test function
 if __name__ == "__main__":
@@ -333,18 +1085,22 @@ if __name__ == "__main__":
     }
     
     # Test regular prompt generation
-    prompt, interval, is_countdown, countdown_from = generate_prompt_with_timing(
+    prompt, interval, is_countdown, countdown_from, source = generate_prompt_with_timing(
         test_character, test_theme, 1, 60, 840
     )
     print(f"Generated prompt: {prompt}")
     print(f"Suggested interval: {interval} seconds")
     print(f"Is countdown: {is_countdown}")
     print(f"Countdown from: {countdown_from}")
+    print(f"Source: {source}")
     
     # Test countdown number generation
-    countdown_text = generate_countdown_number(test_character, test_theme, 10)
+    countdown_text, source = generate_countdown_number(test_character, test_theme, 10)
     print(f"Countdown text: {countdown_text}")
     
     # Test final message
-    final_text = generate_final_message(test_character, test_theme)
-    print(f"Final message: {final_text}")
\ No newline at end of file
+    final_text, source = generate_final_message(test_character, test_theme)
+    print(f"Final message: {final_text}")
+    
+    # Per-profile metrics
+    print(json.dumps(get_generation_metrics(), indent=2))
\ No newline at end of file
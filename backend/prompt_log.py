@@ -0,0 +1,194 @@
+import os
+from typing import Any, Dict, List, Optional
+
+def _load_capacity() -> Optional[int]:
+    """Read PROMPT_LOG_CAPACITY; unset, invalid or <= 0 means keep everything"""
+    raw = os.environ.get("PROMPT_LOG_CAPACITY")
+    if not raw:
+        return None
+    try:
+        capacity = int(raw)
+    except ValueError:
+        print(f"Ignoring invalid PROMPT_LOG_CAPACITY: {raw}")
+        return None
+    return capacity if capacity > 0 else None
+
+# Optional retention limit for each session's prompt log (None = keep everything)
+PROMPT_LOG_CAPACITY = _load_capacity()
+
+class PromptRecord:
+    """
+    A single prompt delivered in a session
+
+    source is "llm", "fallback" (local fallback generator) or "error" (the
+    notice added when the session stops on an unexpected error).
+    """
+    __slots__ = ("seq", "text", "timestamp", "next_interval", "is_countdown", "is_final", "source")
+
+    def __init__(self, seq: int, text: str, timestamp: float, next_interval: Optional[int],
+                 is_countdown: bool, is_final: bool, source: str):
+        self.seq = seq
+        self.text = text
+        self.timestamp = timestamp
+        self.next_interval = next_interval
+        self.is_countdown = is_countdown
+        self.is_final = is_final
+        self.source = source
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert to the JSON shape served by /api/prompts"""
+        data = {
+            "id": self.seq,
+            "text": self.text,
+            "timestamp": self.timestamp,
+            "is_countdown": self.is_countdown,
+            "is_final": self.is_final,
+            "source": self.source
+        }
+        if self.next_interval is not None:
+            data["next_interval"] = self.next_interval
+        return data
+
+class PromptLog:
+    """
+    Append-only log of the prompts delivered in one session
+
+    Designed for a single writer (the session's generator thread) and many
+    readers (request threads polling /api/prompts) without a lock: the writer
+    stores a record in its slot before publishing it by advancing _next_seq,
+    and readers only look at slots below the _next_seq they observed.
+
+    With a capacity the log becomes a ring buffer that keeps only the most
+    recent records; sequence numbers keep increasing regardless.
+    """
+
+    def __init__(self, capacity: Optional[int] = None):
+        if capacity is not None and capacity <= 0:
+            raise ValueError("capacity must be positive")
+        self.capacity = capacity
+        self._slots: List[Optional[PromptRecord]] = [None] * capacity if capacity else []
+        self._next_seq = 0
+
+    def __len__(self) -> int:
+        """Total number of records ever appended"""
+        return self._next_seq
+
+    @property
+    def first_seq(self) -> int:
+        """Sequence number of the oldest record still retained"""
+        if self.capacity is None:
+            return 0
+        return max(0, self._next_seq - self.capacity)
+
+    def append(self, text: str, timestamp: float, next_interval: Optional[int] = None,
+               is_countdown: bool = False, is_final: bool = False, source: str = "llm") -> int:
+        """
+        Append a prompt to the log (writer thread only)
+
+        Returns:
+            The sequence number assigned to the prompt
+        """
+        seq = self._next_seq
+        record = PromptRecord(seq, text, timestamp, next_interval, is_countdown, is_final, source)
+
+        if self.capacity is None:
+            self._slots.append(record)
+        else:
+            self._slots[seq % self.capacity] = record
+
+        # Publish only once the record is in place
+        self._next_seq = seq + 1
+        return seq
+
+    def read_since(self, last_seen: int = -1) -> List[PromptRecord]:
+        """
+        Get the records after a cursor
+
+        Args:
+            last_seen: Sequence number of the last record the reader has seen (-1 for none)
+
+        Returns:
+            Records with a sequence number greater than last_seen, oldest first.
+            Only the new tail is touched; records already evicted from a
+            bounded log are skipped.
+        """
+        end = self._next_seq
+        start = max(last_seen + 1, self.first_seq)
+        if start >= end:
+            return []
+
+        if self.capacity is None:
+            return self._slots[start:end]
+
+        records = []
+        for seq in range(start, end):
+            record = self._slots[seq % self.capacity]
+            # The writer may have lapped this slot since we read _next_seq
+            if record is not None and record.seq == seq:
+                records.append(record)
+        return records
+
+# Simple benchmark
+if __name__ == "__main__":
+    import threading
+    import time
+    import tracemalloc
+
+    NUM_PROMPTS = 10000
+    NUM_READERS = 8
+    text = "Take a breath. Write about a decision that can't be undone."
+
+    # Memory per prompt: plain dicts versus PromptRecord
+    tracemalloc.start()
+    baseline = tracemalloc.take_snapshot()
+    dicts = [
+        {"id": i, "text": text, "timestamp": time.time(), "is_countdown": False,
+         "is_final": False, "source": "llm", "next_interval": 30}
+        for i in range(NUM_PROMPTS)
+    ]
+    dict_bytes = sum(s.size_diff for s in tracemalloc.take_snapshot().compare_to(baseline, "filename"))
+    del dicts
+
+    baseline = tracemalloc.take_snapshot()
+    log = PromptLog()
+    for i in range(NUM_PROMPTS):
+        log.append(text, time.time(), next_interval=30)
+    log_bytes = sum(s.size_diff for s in tracemalloc.take_snapshot().compare_to(baseline, "filename"))
+    tracemalloc.stop()
+
+    print(f"Memory per prompt (dict):         {dict_bytes / NUM_PROMPTS:.0f} bytes")
+    print(f"Memory per prompt (PromptRecord): {log_bytes / NUM_PROMPTS:.0f} bytes")
+
+    # Read latency under concurrent polling while the writer appends
+    for capacity in (None, 256):
+        log = PromptLog(capacity)
+        done = threading.Event()
+        latencies: List[float] = []
+        lock = threading.Lock()
+
+        def reader():
+            cursor = -1
+            local = []
+            while not done.is_set():
+                start = time.perf_counter()
+                records = log.read_since(cursor)
+                local.append(time.perf_counter() - start)
+                if records:
+                    cursor = records[-1].seq
+            with lock:
+                latencies.extend(local)
+
+        readers = [threading.Thread(target=reader) for _ in range(NUM_READERS)]
+        for thread in readers:
+            thread.start()
+        for i in range(NUM_PROMPTS):
+            log.append(text, time.time(), next_interval=30)
+        done.set()
+        for thread in readers:
+            thread.join()
+
+        latencies.sort()
+        p50 = latencies[len(latencies) // 2] * 1e6
+        p99 = latencies[int(len(latencies) * 0.99)] * 1e6
+        print(f"Cursor read latency (capacity={capacity}, {NUM_READERS} readers, "
+              f"{len(latencies)} reads): p50 {p50:.1f} us, p99 {p99:.1f} us")